@@ -1,5 +1,8 @@
-from os import listdir
-from typing import Tuple
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterator, Tuple
 
 import mcp.types as types
 from markitdown import MarkItDown
@@ -32,17 +35,112 @@ PROMPTS = {
     ),
 }
 
+# Built once: construction registers every converter, which is wasted work
+# to repeat per request.
+_MD = MarkItDown()
+
+# MarkItDown is blocking; conversions run here so the event loop stays free.
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=min(32, (os.cpu_count() or 1) * 4),
+    thread_name_prefix="markitdown",
+)
+
+
+def _max_concurrency() -> int:
+    raw = os.environ.get("MD_MAX_CONCURRENCY", "4")
+    try:
+        value = int(raw)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise ValueError(
+            f"MD_MAX_CONCURRENCY must be a positive integer, got {raw!r}"
+        )
+    return value
+
+
+# Caps in-flight conversions; large PDFs/DOCX can each take hundreds of MB.
+_MD_SEM = asyncio.BoundedSemaphore(_max_concurrency())
+
+
+@lru_cache(maxsize=256)
+def _convert_cached(
+    file_path: str, mtime_ns: int, size: int
+) -> Tuple[str | None, str]:
+    # mtime_ns and size only take part in the cache key, so an edited file
+    # misses the cache and gets converted again.
+    result = _MD.convert(file_path)
+    return result.title, result.text_content
+
 
 def convert_to_markdown(file_path: str) -> Tuple[str | None, str]:
     try:
-        md = MarkItDown()
-        result = md.convert(file_path)
-        return result.title, result.text_content
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # Not a local file (e.g. an http(s) URI): nothing to key a cache
+            # entry on, so always convert.
+            result = _MD.convert(file_path)
+            return result.title, result.text_content
+
+        return _convert_cached(file_path, stat.st_mtime_ns, stat.st_size)
 
     except Exception as e:
         return None, f"Error converting document: {str(e)}"
 
 
+def _scan_names(directory: str) -> list[str]:
+    # Sorting here keeps it in the worker thread and lets the listing make a
+    # single pass over the names. Undecodable bytes come back from scandir
+    # as lone surrogates, which can't be encoded as UTF-8; swap them for
+    # U+FFFD so every name can be serialized.
+    with os.scandir(directory) as entries:
+        return sorted(
+            entry.name.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+            for entry in entries
+        )
+
+
+async def list_directory(directory: str) -> list[str]:
+    """Return the sorted entry names in directory, read off the event loop."""
+    return await asyncio.to_thread(_scan_names, directory)
+
+
+def iter_ls_lines(directory: str, files: list[str]) -> Iterator[str]:
+    """Yield the formatted ls listing piece by piece so it can be streamed.
+
+    files is expected in display order, as returned by list_directory().
+    """
+    # Format the output in a structured, informative way
+    yield f"Directory listing for: {directory}\n"
+    yield f"Total files: {len(files)}\n\n"
+
+    # Group files by type if possible
+    extensions = {}
+    no_extension = []
+
+    for file in files:
+        _, dot, ext = file.rpartition(".")
+        if dot:
+            extensions.setdefault(ext.lower(), []).append(file)
+        else:
+            no_extension.append(file)
+
+    # Add file groupings to output
+    if extensions:
+        yield "Files by type:\n"
+        for ext, files_of_type in extensions.items():
+            yield f"- {ext.upper()} files ({len(files_of_type)}): {', '.join(files_of_type)}\n"
+
+    if no_extension:
+        yield f"\nFiles without extension ({len(no_extension)}): {', '.join(no_extension)}\n"
+
+    # Add complete listing
+    yield "\nComplete file listing:\n"
+    for idx, file in enumerate(files, 1):
+        yield f"{idx}. {file}\n"
+
+
 # Initialize server
 app = Server("document-conversion-server")
 
@@ -69,7 +167,11 @@ async def get_prompt(
             raise ValueError("file_path is required")
 
         try:
-            markdown_title, markdown_content = convert_to_markdown(file_path)
+            loop = asyncio.get_running_loop()
+            async with _MD_SEM:
+                markdown_title, markdown_content = await loop.run_in_executor(
+                    _EXECUTOR, convert_to_markdown, file_path
+                )
 
             return types.GetPromptResult(
                 messages=[
@@ -89,39 +191,8 @@ async def get_prompt(
     elif name == "ls":
         try:
             directory = arguments["directory"]
-            files = listdir(directory)
-
-            # Format the output in a structured, informative way
-            file_count = len(files)
-            formatted_output = f"Directory listing for: {directory}\n"
-            formatted_output += f"Total files: {file_count}\n\n"
-
-            # Group files by type if possible
-            extensions = {}
-            no_extension = []
-
-            for file in files:
-                if "." in file:
-                    ext = file.split(".")[-1].lower()
-                    if ext not in extensions:
-                        extensions[ext] = []
-                    extensions[ext].append(file)
-                else:
-                    no_extension.append(file)
-
-            # Add file groupings to output
-            if extensions:
-                formatted_output += "Files by type:\n"
-                for ext, files_of_type in extensions.items():
-                    formatted_output += f"- {ext.upper()} files ({len(files_of_type)}): {', '.join(files_of_type)}\n"
-
-            if no_extension:
-                formatted_output += f"\nFiles without extension ({len(no_extension)}): {', '.join(no_extension)}\n"
-
-            # Add complete listing
-            formatted_output += "\nComplete file listing:\n"
-            for idx, file in enumerate(sorted(files), 1):
-                formatted_output += f"{idx}. {file}\n"
+            files = await list_directory(directory)
+            formatted_output = "".join(iter_ls_lines(directory, files))
 
             return types.GetPromptResult(
                 messages=[
@@ -139,17 +210,18 @@ async def get_prompt(
     raise ValueError("Prompt implementation not found")
 
 
+# Built after the handlers above are registered, since the advertised
+# capabilities are derived from them.
+INIT_OPTIONS = InitializationOptions(  # Fixed reference
+    server_name="example",
+    server_version="0.1.0",
+    capabilities=app.get_capabilities(
+        notification_options=NotificationOptions(),
+        experimental_capabilities={},
+    ),
+)
+
+
 async def run():
     async with stdio.stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(  # Fixed reference
-                server_name="example",
-                server_version="0.1.0",
-                capabilities=app.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
-                ),
-            ),
-        )
+        await app.run(read_stream, write_stream, INIT_OPTIONS)
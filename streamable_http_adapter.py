@@ -2,15 +2,21 @@
 """
 Streamable HTTP -> MCP stdio bridge for markitdown_mcp_server.
 
-This adapter creates an HTTP server that accepts MCP messages and forwards them
-to the MCP server using proper async streams.
+This adapter creates an HTTP server that accepts MCP messages and dispatches
+them directly to the MCP server's prompt handlers.
 """
-import asyncio
 import json
 import logging
 import sys
 import os
 from aiohttp import web
+from aiohttp.web_log import AccessLogger
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the stdlib encoder
+    orjson = None
 
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "src"))
@@ -22,107 +28,101 @@ except ImportError:
     from src.markitdown_mcp_server import server as mcp_module
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 
-class MemoryReader:
-    """Memory-based stream reader compatible with MCP."""
-
-    def __init__(self):
-        self._data = b""
-        self._position = 0
-        self._eof = False
-
-    def write(self, data: bytes):
-        """Write data to the stream."""
-        self._data += data
-
-    def set_eof(self):
-        """Mark end of stream."""
-        self._eof = True
-
-    async def read(self, n: int = -1) -> bytes:
-        """Read n bytes from the stream."""
-        if self._position >= len(self._data):
-            if self._eof:
-                return b""
-            # Wait a bit for more data
-            await asyncio.sleep(0.01)
-            if self._position >= len(self._data):
-                return b""
-
-        if n == -1:
-            result = self._data[self._position:]
-            self._position = len(self._data)
-        else:
-            end = min(self._position + n, len(self._data))
-            result = self._data[self._position:end]
-            self._position = end
-
-        return result
-
-    async def readline(self) -> bytes:
-        """Read a line from the stream."""
-        start = self._position
-
-        # Look for newline
-        while self._position < len(self._data):
-            if self._data[self._position:self._position + 1] == b'\n':
-                self._position += 1
-                return self._data[start:self._position]
-            self._position += 1
-
-        # No newline found
-        if self._eof and start < len(self._data):
-            # Return remaining data
-            result = self._data[start:]
-            self._position = len(self._data)
-            return result
-
-        if self._eof:
-            return b""
+def _std_dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+if orjson is not None:
+    def _dumps(obj) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            # orjson rejects lone surrogates (e.g. undecodable filenames)
+            # that the stdlib escapes; keep output independent of orjson
+            return _std_dumps(obj)
+
+    _loads = orjson.loads
+else:
+    _dumps = _std_dumps
+    _loads = json.loads
+
+
+# The initialize result only depends on the server definition, so it is
+# serialized once and reused for every handshake.
+_INIT_RESULT_JSON = _dumps({
+    "protocolVersion": "2024-11-05",
+    "capabilities": mcp_module.INIT_OPTIONS.capabilities.model_dump(
+        mode="json", by_alias=True, exclude_none=True
+    ),
+    "serverInfo": {
+        "name": "markitdown_mcp_server",
+        "version": "0.1.0"
+    }
+})
+
+# PROMPTS is static, so the prompts/list result is kept only as pre-encoded
+# bytes; each call splices in the request id and allocates nothing else.
+_PROMPTS_LIST_RESULT_JSON = _dumps({
+    "prompts": [
+        {
+            "name": p.name,
+            "description": p.description,
+            "arguments": [
+                {
+                    "name": arg.name,
+                    "description": arg.description,
+                    "required": arg.required
+                }
+                for arg in (p.arguments or [])
+            ]
+        }
+        for p in mcp_module.PROMPTS.values()
+    ]
+})
 
-        # Reset position and wait
-        self._position = start
-        await asyncio.sleep(0.01)
-        return b""
 
-    async def readexactly(self, n: int) -> bytes:
-        """Read exactly n bytes."""
-        result = await self.read(n)
-        if len(result) < n:
-            raise asyncio.IncompleteReadError(result, n)
-        return result
+# Flush threshold when streaming large prompt text to the client.
+_STREAM_CHUNK_SIZE = 64 * 1024
 
+# Chunk size for reading request bodies off the socket.
+_READ_CHUNK_SIZE = 64 * 1024
 
-class MemoryWriter:
-    """Memory-based stream writer compatible with MCP."""
+# JSON around the text of a streamed ls prompt result.
+_LS_RESULT_HEAD = (
+    b',"result":{"messages":[{"role":"user",'
+    b'"content":{"type":"text","text":"'
+)
+_LS_RESULT_TAIL = b'"}}]}}\n'
 
-    def __init__(self):
-        self._data = []
 
-    async def write(self, data: bytes):
-        """Write data to the stream."""
-        self._data.append(data)
+class _StreamAborted(Exception):
+    """Raised when a chunked reply fails after its headers were sent."""
 
-    async def drain(self):
-        """Drain the stream."""
-        pass
 
-    async def close(self):
-        """Close the stream."""
-        pass
+def _result_bytes(msg_id, result_json: bytes) -> bytes:
+    """Wrap an already serialized result in a JSON-RPC response line."""
+    return (
+        b'{"jsonrpc":"2.0","id":' + _dumps(msg_id)
+        + b',"result":' + result_json + b"}\n"
+    )
 
-    def get_data(self) -> bytes:
-        """Get all written data."""
-        return b"".join(self._data)
 
+def _json_response(body: bytes, status: int = 200) -> web.Response:
+    """Build a plain, Content-Length framed JSON reply."""
+    return web.Response(
+        status=status,
+        body=body,
+        content_type="application/json",
+        headers={"Cache-Control": "no-cache"},
+    )
 
-async def mcp_handler(request: web.Request) -> web.StreamResponse:
-    """Handle MCP requests over HTTP with SSE streaming."""
-    logger.debug("Received MCP request")
 
+async def _open_stream(request: web.Request) -> web.StreamResponse:
+    """Start a chunked JSON reply for results that may be large."""
     resp = web.StreamResponse(
         status=200,
         reason="OK",
@@ -132,11 +132,123 @@ async def mcp_handler(request: web.Request) -> web.StreamResponse:
         },
     )
     await resp.prepare(request)
+    return resp
+
+
+async def _write_ls(
+    resp: web.StreamResponse, msg_id, directory: str, files: list[str]
+) -> None:
+    """Stream the ls prompt result without building the listing in memory."""
+    pending = [b'{"jsonrpc":"2.0","id":' + _dumps(msg_id) + _LS_RESULT_HEAD]
+    size = 0
+    for piece in mcp_module.iter_ls_lines(directory, files):
+        # Drop the quotes from the encoded string to get its escaped body
+        encoded = _dumps(piece)[1:-1]
+        pending.append(encoded)
+        size += len(encoded)
+        if size >= _STREAM_CHUNK_SIZE:
+            await resp.write(b"".join(pending))
+            pending.clear()
+            size = 0
+
+    pending.append(_LS_RESULT_TAIL)
+    await resp.write(b"".join(pending))
+
+
+async def _read_body(request: web.Request) -> bytearray:
+    """Read the request body into a single buffer.
+
+    request.read() accumulates into a bytearray and then copies it to bytes;
+    both JSON parsers accept the bytearray, so that second copy is skipped.
+    """
+    # Enforce the app's client_max_size like request.read() does (0 = no cap)
+    max_size = request.client_max_size
+    body = bytearray()
+    async for chunk in request.content.iter_chunked(_READ_CHUNK_SIZE):
+        body.extend(chunk)
+        if max_size and len(body) > max_size:
+            raise web.HTTPRequestEntityTooLarge(
+                max_size=max_size, actual_size=len(body)
+            )
+    return body
+
+
+async def _handle_initialize(
+    request: web.Request, msg_id, params
+) -> web.StreamResponse:
+    """Answer the initialize handshake."""
+    return _json_response(_result_bytes(msg_id, _INIT_RESULT_JSON))
+
+
+async def _handle_list(
+    request: web.Request, msg_id, params
+) -> web.StreamResponse:
+    """Return the static prompt list."""
+    return _json_response(_result_bytes(msg_id, _PROMPTS_LIST_RESULT_JSON))
+
+
+async def _handle_get(
+    request: web.Request, msg_id, params
+) -> web.StreamResponse:
+    """Render a specific prompt."""
+    name = params.get("name")
+    arguments = params.get("arguments")
+
+    if name == "ls":
+        # List before the stream starts so failures can still be reported
+        try:
+            directory = arguments["directory"]
+            files = await mcp_module.list_directory(directory)
+        except Exception as e:
+            raise ValueError(f"Error listing directory: {str(e)}")
+
+        # Listings can be huge; stream them instead of materializing
+        resp = await _open_stream(request)
+        try:
+            await _write_ls(resp, msg_id, directory, files)
+            await resp.write_eof()
+        except Exception as e:
+            raise _StreamAborted("Error streaming ls result") from e
+        return resp
+
+    prompt_result = await mcp_module.get_prompt(name, arguments)
+
+    result = {
+        "jsonrpc": "2.0",
+        "id": msg_id,
+        "result": {
+            "messages": [
+                {
+                    "role": msg.role,
+                    "content": {
+                        "type": msg.content.type,
+                        "text": msg.content.text
+                    }
+                }
+                for msg in prompt_result.messages
+            ]
+        }
+    }
+    # The converted text is already in memory, so chunking would save
+    # nothing; send it in one Content-Length framed write
+    return _json_response(_dumps(result) + b"\n")
+
+
+_DISPATCH = {
+    "initialize": _handle_initialize,
+    "prompts/list": _handle_list,
+    "prompts/get": _handle_get,
+}
+
+
+async def mcp_handler(request: web.Request) -> web.StreamResponse:
+    """Handle MCP requests over HTTP."""
+    logger.debug("Received MCP request")
 
     # Read the request body
     try:
-        request_data = await request.read()
-        logger.debug(f"Request data: {request_data[:200]}")
+        request_data = await _read_body(request)
+        logger.debug("Request data: %s", bytes(request_data[:200]))
 
         if not request_data:
             logger.error("Empty request body")
@@ -145,35 +257,42 @@ async def mcp_handler(request: web.Request) -> web.StreamResponse:
                 "id": None,
                 "error": {"code": -32600, "message": "Empty request body"}
             }
-            await resp.write(json.dumps(error_resp).encode() + b"\n")
-            await resp.write_eof()
-            return resp
+            return _json_response(_dumps(error_resp) + b"\n", status=400)
+
+    except web.HTTPException:
+        # e.g. 413 from _read_body; aiohttp renders these itself
+        raise
 
     except Exception as e:
-        logger.error(f"Error reading request: {e}")
+        logger.error("Error reading request: %s", e)
         error_resp = {
             "jsonrpc": "2.0",
             "id": None,
             "error": {"code": -32603, "message": str(e)}
         }
-        await resp.write(json.dumps(error_resp).encode() + b"\n")
-        await resp.write_eof()
-        return resp
+        return _json_response(_dumps(error_resp) + b"\n", status=400)
 
     # Parse the JSON-RPC message
     try:
-        message = json.loads(request_data.decode('utf-8'))
-        logger.debug(f"Parsed message: {message}")
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON: {e}")
+        message = _loads(request_data)
+        logger.debug("Parsed message: %s", message)
+    except ValueError as e:
+        logger.error("Invalid JSON: %s", e)
         error_resp = {
             "jsonrpc": "2.0",
             "id": None,
             "error": {"code": -32700, "message": f"Parse error: {str(e)}"}
         }
-        await resp.write(json.dumps(error_resp).encode() + b"\n")
-        await resp.write_eof()
-        return resp
+        return _json_response(_dumps(error_resp) + b"\n", status=400)
+
+    if not isinstance(message, dict):
+        logger.error("Request is not a JSON-RPC object")
+        error_resp = {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {"code": -32600, "message": "Invalid Request"}
+        }
+        return _json_response(_dumps(error_resp) + b"\n", status=400)
 
     # Handle the message directly based on method
     try:
@@ -181,110 +300,45 @@ async def mcp_handler(request: web.Request) -> web.StreamResponse:
         msg_id = message.get("id")
         params = message.get("params", {})
 
-        if method == "initialize":
-            # Handle initialize
-            from mcp.server import NotificationOptions
-
-            result = {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "prompts": {
-                            "listChanged": False
-                        }
-                    },
-                    "serverInfo": {
-                        "name": "markitdown_mcp_server",
-                        "version": "0.1.0"
-                    }
-                }
-            }
-            await resp.write(json.dumps(result).encode() + b"\n")
-
-        elif method == "prompts/list":
-            # Get prompts from the server
-            prompts_list = await mcp_module.list_prompts()
-
-            result = {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "prompts": [
-                        {
-                            "name": p.name,
-                            "description": p.description,
-                            "arguments": [
-                                {
-                                    "name": arg.name,
-                                    "description": arg.description,
-                                    "required": arg.required
-                                }
-                                for arg in (p.arguments or [])
-                            ]
-                        }
-                        for p in prompts_list
-                    ]
-                }
-            }
-            await resp.write(json.dumps(result).encode() + b"\n")
-
-        elif method == "prompts/get":
-            # Get a specific prompt
-            name = params.get("name")
-            arguments = params.get("arguments")
+        handler = _DISPATCH.get(method)
+        if handler is not None:
+            return await handler(request, msg_id, params)
 
-            prompt_result = await mcp_module.get_prompt(name, arguments)
-
-            result = {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "messages": [
-                        {
-                            "role": msg.role,
-                            "content": {
-                                "type": msg.content.type,
-                                "text": msg.content.text
-                            }
-                        }
-                        for msg in prompt_result.messages
-                    ]
-                }
+        # Unknown method
+        error_resp = {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "error": {
+                "code": -32601,
+                "message": f"Method not found: {method}"
             }
-            await resp.write(json.dumps(result).encode() + b"\n")
+        }
 
-        else:
-            # Unknown method
-            error_resp = {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "error": {
-                    "code": -32601,
-                    "message": f"Method not found: {method}"
-                }
-            }
-            await resp.write(json.dumps(error_resp).encode() + b"\n")
+    except _StreamAborted:
+        # A 200 reply is already on the wire, so no error response can
+        # follow it; let aiohttp log the error and drop the connection.
+        raise
 
     except Exception as e:
-        logger.error(f"Error handling request: {e}", exc_info=True)
+        logger.error("Error handling request: %s", e, exc_info=True)
         error_resp = {
             "jsonrpc": "2.0",
-            "id": message.get("id") if isinstance(message, dict) else None,
+            "id": message.get("id"),
             "error": {
                 "code": -32603,
                 "message": f"Internal error: {str(e)}"
             }
         }
-        await resp.write(json.dumps(error_resp).encode() + b"\n")
 
-    try:
-        await resp.write_eof()
-    except Exception:
-        pass
+    return _json_response(_dumps(error_resp) + b"\n")
 
-    return resp
+
+class HealthQuietAccessLogger(AccessLogger):
+    """Access logger that leaves out health check probes."""
+
+    def log(self, request, response, time):
+        if request.path != "/health":
+            super().log(request, response, time)
 
 
 async def health(request):
@@ -292,7 +346,7 @@ async def health(request):
     return web.Response(text="ok")
 
 
-def main(host="0.0.0.0", port=8080):
+def main(host=None, port=None):
     """Start the HTTP server."""
     app = web.Application()
     app.add_routes([
@@ -300,8 +354,26 @@ def main(host="0.0.0.0", port=8080):
         web.get("/health", health)
     ])
 
-    logger.info(f"Starting server on {host}:{port}")
-    web.run_app(app, host=host, port=port)
+    if host is None:
+        host = os.environ.get("HOST", "0.0.0.0")
+    if port is None:
+        port = int(os.environ.get("PORT", "8080"))
+
+    try:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        # uvloop is optional; aiohttp creates a default asyncio loop
+        loop = None
+
+    logger.info("Starting server on %s:%s", host, port)
+    web.run_app(
+        app,
+        host=host,
+        port=port,
+        access_log_class=HealthQuietAccessLogger,
+        loop=loop,
+    )
 
 
 if __name__ == "__main__":
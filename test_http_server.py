@@ -5,141 +5,319 @@ Test script for the MCP HTTP server.
 This script tests the streamable HTTP adapter by sending MCP messages
 to the server and verifying the responses.
 """
+import argparse
 import asyncio
 import json
+import os
 import sys
-from aiohttp import ClientSession
+import time
+import traceback
+from aiohttp import ClientSession, TCPConnector
 
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the stdlib json module
+    orjson = None
 
-async def test_health_endpoint(base_url: str):
-    """Test the health check endpoint."""
-    print("Testing health endpoint...")
-    async with ClientSession() as session:
-        async with session.get(f"{base_url}/health") as resp:
-            text = await resp.text()
-            assert resp.status == 200
-            assert text == "ok"
-            print("✓ Health check passed")
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
 
+    def _loads(data):
+        # json.loads does not take memoryviews
+        return json.loads(bytes(data))
 
-async def test_initialize(base_url: str):
-    """Test the MCP initialize request."""
-    print("\nTesting MCP initialize request...")
+# Per-response details are only printed with TEST_VERBOSE set, so the
+# script stays cheap when used to generate load.
+VERBOSE = bool(os.environ.get("TEST_VERBOSE"))
 
-    initialize_request = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "initialize",
-        "params": {
-            "protocolVersion": "2024-11-05",
-            "capabilities": {
-                "roots": {
-                    "listChanged": True
-                },
-                "sampling": {}
+# Request bodies never change, so they are encoded once.
+INIT_ID = 1
+INIT_BODY: bytes = _dumps({
+    "jsonrpc": "2.0",
+    "id": INIT_ID,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {
+            "roots": {
+                "listChanged": True
             },
-            "clientInfo": {
-                "name": "test-client",
-                "version": "1.0.0"
-            }
+            "sampling": {}
+        },
+        "clientInfo": {
+            "name": "test-client",
+            "version": "1.0.0"
         }
     }
+})
+
+LIST_PROMPTS_ID = 2
+LIST_PROMPTS_BODY: bytes = _dumps({
+    "jsonrpc": "2.0",
+    "id": LIST_PROMPTS_ID,
+    "method": "prompts/list",
+    "params": {}
+})
+
+# Upper bound on each read from the response stream.
+_READ_CHUNK_SIZE = 16 * 1024
+
+# SSE field prefix, matched on raw bytes.
+_DATA_PREFIX = b"data: "
+_DATA_LEN = len(_DATA_PREFIX)
+
+
+def _parse_frame(buf: bytearray, view: memoryview, start: int, end: int):
+    """Parse the JSON payload of the frame at buf[start:end].
+
+    The payload is handed to the parser as a memoryview slice of the
+    receive buffer, so it is never copied out. The data: field may follow
+    other fields such as event:, and its value runs to the end of its line.
+    A frame without a data: field is a plain JSON body.
+    """
+    if buf.startswith(_DATA_PREFIX, start):
+        field = start
+    else:
+        field = buf.find(b"\n" + _DATA_PREFIX, start, end)
+        if field >= 0:
+            field += 1
+    if field >= 0:
+        start = field + _DATA_LEN
+        line_end = buf.find(b"\n", start, end)
+        if line_end >= 0:
+            end = line_end
+    payload = view[start:end]
+    try:
+        return _loads(payload)
+    except ValueError as e:
+        print(f"Failed to parse JSON: {bytes(payload)}")
+        print(f"Error: {e}")
+        return None
 
-    async with ClientSession() as session:
-        async with session.post(
-            f"{base_url}/mcp",
-            json=initialize_request,
-            headers={"Content-Type": "application/json"}
-        ) as resp:
+
+async def iter_sse_data(resp):
+    """Yield each JSON-RPC message carried by the frames of a response.
+
+    Frames are split on the blank line that ends them and parsed in place;
+    a plain JSON body is parsed as a single frame. Frames that fail to
+    parse are reported and skipped.
+    """
+    buf = bytearray()
+    # buf is only ever resized in place, so its bound methods stay valid;
+    # binding them once keeps global/attribute lookups out of the loop.
+    extend = buf.extend
+    find = buf.find
+    parse = _parse_frame
+    async for chunk in resp.content.iter_chunked(_READ_CHUNK_SIZE):
+        extend(chunk)
+        # Walk every complete frame in place and drop them all at once,
+        # rather than re-slicing the remainder after each frame.
+        messages = []
+        start = 0
+        with memoryview(buf) as view:
+            while True:
+                end = find(b"\n\n", start)
+                if end < 0:
+                    break
+                if end > start:
+                    messages.append(parse(buf, view, start, end))
+                start = end + 2
+        # Compact in place so the buffer's storage is reused across chunks;
+        # the view is released first, as a bytearray with exports can't resize
+        del buf[:start]
+        for message in messages:
+            if message is not None:
+                yield message
+
+    # Last frame, if the stream ended without a blank line
+    if buf and buf != b"\n":
+        with memoryview(buf) as view:
+            message = _parse_frame(buf, view, 0, len(buf))
+        if message is not None:
+            yield message
+
+
+async def test_health_endpoint(session: ClientSession, base_url: str):
+    """Test the health check endpoint."""
+    print("Testing health endpoint...")
+    async with session.get(f"{base_url}/health") as resp:
+        text = await resp.text()
+        assert resp.status == 200
+        assert text == "ok"
+        print("✓ Health check passed")
+
+
+async def _rpc(
+    session: ClientSession, url: str, body: bytes, expected_id: int
+) -> list:
+    """Send one JSON-RPC request and collect messages up to its reply."""
+    responses = []
+    append = responses.append
+    async with session.post(url, data=body) as resp:
+        if VERBOSE:
             print(f"Response status: {resp.status}")
             print(f"Response headers: {resp.headers}")
 
-            # Read SSE stream
-            responses = []
-            async for line in resp.content:
-                line = line.decode('utf-8').strip()
-                if line.startswith("data: "):
-                    data = line[6:]  # Remove "data: " prefix
-                    try:
-                        response = json.loads(data)
-                        responses.append(response)
-                        print(f"Received: {json.dumps(response, indent=2)}")
-                    except json.JSONDecodeError as e:
-                        print(f"Failed to parse JSON: {data}")
-                        print(f"Error: {e}")
-
-            if responses:
-                print("✓ Initialize request completed")
-                return responses
-            else:
-                print("✗ No responses received")
-                return []
+        async for response in iter_sse_data(resp):
+            append(response)
+            if VERBOSE:
+                print(f"Received: {json.dumps(response, indent=2)}")
+            if response.get("id") == expected_id:
+                # Our reply is complete; return the connection to the
+                # pool right away instead of at the end of the block
+                resp.release()
+                break
+
+    return responses
 
 
-async def test_list_prompts(base_url: str):
+def _report(responses: list, label: str) -> list:
+    """Print the outcome of a JSON-RPC test and pass its messages on."""
+    if not responses:
+        raise RuntimeError(f"{label}: no responses received")
+    print(f"✓ {label} completed")
+    return responses
+
+
+async def test_initialize(session: ClientSession, base_url: str):
+    """Test the MCP initialize request."""
+    print("\nTesting MCP initialize request...")
+    responses = await _rpc(session, f"{base_url}/mcp", INIT_BODY, INIT_ID)
+    return _report(responses, "Initialize request")
+
+
+async def test_list_prompts(session: ClientSession, base_url: str):
     """Test listing available prompts."""
     print("\nTesting prompts/list request...")
+    responses = await _rpc(
+        session, f"{base_url}/mcp", LIST_PROMPTS_BODY, LIST_PROMPTS_ID
+    )
+    return _report(responses, "List prompts")
 
-    list_prompts_request = {
-        "jsonrpc": "2.0",
-        "id": 2,
-        "method": "prompts/list",
-        "params": {}
-    }
 
-    async with ClientSession() as session:
-        async with session.post(
-            f"{base_url}/mcp",
-            json=list_prompts_request,
-            headers={"Content-Type": "application/json"}
-        ) as resp:
-            print(f"Response status: {resp.status}")
+async def run_load(
+    session: ClientSession, base_url: str, concurrency: int, iterations: int
+):
+    """Send initialize requests from concurrent workers and report latency.
 
-            # Read SSE stream
-            responses = []
-            async for line in resp.content:
-                line = line.decode('utf-8').strip()
-                if line.startswith("data: "):
-                    data = line[6:]
-                    try:
-                        response = json.loads(data)
-                        responses.append(response)
-                        print(f"Received: {json.dumps(response, indent=2)}")
-                    except json.JSONDecodeError:
-                        print(f"Failed to parse: {data}")
-
-            if responses:
-                print("✓ List prompts completed")
-                return responses
-            else:
-                print("✗ No responses received")
-                return []
+    Returns the workers' results so failures can be reported with the
+    smoke tests'.
+    """
+    url = f"{base_url}/mcp"
+    latencies = []
+
+    async def worker():
+        for _ in range(iterations):
+            start = time.perf_counter()
+            responses = await _rpc(session, url, INIT_BODY, INIT_ID)
+            if not responses or responses[-1].get("id") != INIT_ID:
+                raise RuntimeError(f"No reply with id {INIT_ID} received")
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(worker() for _ in range(concurrency)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        return results
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    print(
+        f"{len(latencies)} requests with concurrency {concurrency} in "
+        f"{elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)"
+    )
+    print(
+        f"Latency p50 {percentile(0.50):.2f} ms, p90 {percentile(0.90):.2f} ms, "
+        f"p99 {percentile(0.99):.2f} ms, max {latencies[-1] * 1000:.2f} ms"
+    )
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Test the MCP HTTP server.")
+    parser.add_argument(
+        "base_url", nargs="?", default="http://localhost:8080",
+        help="server URL (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1,
+        help="number of concurrent workers in load mode (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=0,
+        help="requests per worker; a positive value runs a load test "
+             "instead of the smoke tests",
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.iterations < 0:
+        parser.error("--iterations must not be negative")
+    return args
 
 
 async def main():
     """Run all tests."""
-    base_url = "http://localhost:8080"
-
-    if len(sys.argv) > 1:
-        base_url = sys.argv[1]
+    args = parse_args()
+    base_url = args.base_url
 
     print(f"Testing MCP HTTP server at {base_url}\n")
 
-    try:
-        await test_health_endpoint(base_url)
-        await test_initialize(base_url)
-        await test_list_prompts(base_url)
-
-        print("\n" + "="*50)
-        print("All tests completed!")
-        print("="*50)
-
-    except Exception as e:
-        print(f"\n✗ Test failed with error: {e}")
-        import traceback
-        traceback.print_exc()
+    # One pooled session so every request reuses the same keep-alive
+    # connection instead of opening a new one. The host is resolved once
+    # and cached for the whole run (asynchronously if aiodns is installed).
+    connector = TCPConnector(
+        limit=max(32, args.concurrency), keepalive_timeout=85, ttl_dns_cache=300
+    )
+    async with ClientSession(
+        connector=connector,
+        headers={"Content-Type": "application/json"},
+    ) as session:
+        if args.iterations > 0:
+            results = await run_load(
+                session, base_url, args.concurrency, args.iterations
+            )
+            names = [f"load worker {i}" for i in range(1, len(results) + 1)]
+        else:
+            # The tests are independent, so their round trips can overlap
+            results = await asyncio.gather(
+                test_health_endpoint(session, base_url),
+                test_initialize(session, base_url),
+                test_list_prompts(session, base_url),
+                return_exceptions=True,
+            )
+            names = ["health", "initialize", "prompts/list"]
+
+    failures = [
+        (name, r) for name, r in zip(names, results)
+        if isinstance(r, BaseException)
+    ]
+    if failures:
+        for name, e in failures:
+            if VERBOSE:
+                print(f"\n✗ {name} failed with error: {e}")
+                traceback.print_exception(e)
+            else:
+                print(f"\n✗ {name}: {type(e).__name__}: {e}", file=sys.stderr)
         sys.exit(1)
 
+    if args.iterations > 0:
+        return
+
+    print("\n" + "="*50)
+    print("All tests completed!")
+    print("="*50)
+
 
 if __name__ == "__main__":
     asyncio.run(main())